@@ -2,13 +2,29 @@
 # manages configuration related tasks
 import os
 import json
+import time
+import asyncio
+import weakref
 import discord
 from discord.ext import commands
 from discord import app_commands
+from typing import Optional
+from storage import read_json, write_json_versioned
+from responder import PAGE_BODY_LIMIT, Responder, split_pages
 
 # Directory where configs are stored
 CONFIG_DIR = "guild_configs"
 
+# On-demand member lookups: how long results are kept, how many, and ids per gateway request
+MEMBER_CACHE_TTL = 300
+# misses expire sooner so someone who just joined isn't treated as a stranger for long
+MEMBER_MISS_TTL = 15
+MEMBER_CACHE_MAX = 5000
+MEMBER_QUERY_BATCH = 100
+
+# list_staff rows per page, display names are at most 32 characters so this stays under the message limit
+STAFF_ROWS_PER_PAGE = 40
+
 # Resolve cogs directory relative to this file (robust to working directory)
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))
 COGS_DIR = os.path.join(os.path.dirname(SCRIPT_DIR), "cogs")
@@ -21,6 +37,10 @@ if not os.path.exists(CONFIG_DIR):
 class ConfigManager(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        # (guild_id, user_id) -> (expires_at, member or None)
+        self.member_cache: dict[tuple[int, int], tuple[float, Optional[discord.Member]]] = {}
+        # guild_id -> lock around config read-modify-write, dropped once nobody holds or waits on it
+        self.config_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
 
     # config helpers
     def get_guild_config_path(self, guild: discord.Guild) -> str:
@@ -29,16 +49,60 @@ class ConfigManager(commands.Cog):
         return os.path.join(guild_folder, "config.json")
 
     def load_config(self, guild: discord.Guild) -> dict:
-        path = self.get_guild_config_path(guild)
-        if os.path.exists(path):
-            with open(path, "r") as f:
-                return json.load(f)
-        return {}
+        return read_json(self.get_guild_config_path(guild))
 
     def save_config(self, guild: discord.Guild, data: dict):
-        path = self.get_guild_config_path(guild)
-        with open(path, "w") as f:
-            json.dump(data, f, indent=4)
+        """Raises storage.VersionConflict if the config changed since `data` was loaded."""
+        write_json_versioned(self.get_guild_config_path(guild), data)
+
+    def config_lock(self, guild: discord.Guild) -> asyncio.Lock:
+        """Per-guild lock, hold it across load_config -> save_config."""
+        lock = self.config_locks.get(guild.id)
+        if lock is None:
+            lock = self.config_locks[guild.id] = asyncio.Lock()
+        return lock
+
+    # ----- member helpers -----
+    async def resolve_members(self, guild: discord.Guild, user_ids: list[int]) -> dict[int, Optional[discord.Member]]:
+        """Resolve members from the member cache, then the TTL cache, then batched gateway queries.
+        Works whether or not the bot keeps a full member cache. Missing members map to None."""
+        if guild.chunked:
+            # the member cache is complete (it stops counting as chunked once a join goes uncached), a miss is final
+            return {uid: guild.get_member(uid) for uid in user_ids}
+        now = time.monotonic()
+        resolved = {}
+        missing = []
+        for uid in dict.fromkeys(user_ids):
+            member = guild.get_member(uid)
+            if member:
+                resolved[uid] = member
+                continue
+            cached = self.member_cache.get((guild.id, uid))
+            if cached and cached[0] > now:
+                resolved[uid] = cached[1]
+                continue
+            missing.append(uid)
+
+        for i in range(0, len(missing), MEMBER_QUERY_BATCH):
+            batch = missing[i:i + MEMBER_QUERY_BATCH]
+            try:
+                found = await guild.query_members(user_ids=batch, limit=MEMBER_QUERY_BATCH, cache=False)
+            except (asyncio.TimeoutError, discord.ClientException):
+                found = []
+            by_id = {m.id: m for m in found}
+            for uid in batch:
+                # misses are cached too so unknown ids don't trigger a query every time
+                resolved[uid] = by_id.get(uid)
+                self.member_cache.pop((guild.id, uid), None)
+                ttl = MEMBER_CACHE_TTL if resolved[uid] else MEMBER_MISS_TTL
+                self.member_cache[(guild.id, uid)] = (now + ttl, resolved[uid])
+
+        while len(self.member_cache) > MEMBER_CACHE_MAX:
+            self.member_cache.pop(next(iter(self.member_cache)))
+        return resolved
+
+    async def resolve_member(self, guild: discord.Guild, user_id: int) -> Optional[discord.Member]:
+        return (await self.resolve_members(guild, [user_id]))[user_id]
 
     # ----- permission helpers -----
     async def has_elevated_perms(self, user: discord.abc.User, guild: discord.Guild) -> bool:
@@ -70,117 +134,202 @@ class ConfigManager(commands.Cog):
     # ----- configuration slash commands -----
     @app_commands.command(name="set_thread_channel", description="Set the Rainfall thread channel for this guild.")
     async def set_thread_channel(self, interaction: discord.Interaction, channel: discord.TextChannel):
-        if not await self.is_admin(interaction.user, interaction.guild):
-            await interaction.response.send_message(
-                "Only Rainfall Admins, the guild owner, administrators, or the bot owner can run this.",
-                ephemeral=True
-            )
-            return
-
-        config = self.load_config(interaction.guild)
-        config["rainfall_thread_channel"] = channel.id
-        self.save_config(interaction.guild, config)
-        await interaction.response.send_message(
-            f"Rainfall thread channel set to {channel.mention} (ID: {channel.id})",
-            ephemeral=True
-        )
+        async with Responder(interaction) as respond:
+            if not await self.is_admin(interaction.user, interaction.guild):
+                await respond.send("Only Rainfall Admins, the guild owner, administrators, or the bot owner can run this.")
+                return
+
+            async with self.config_lock(interaction.guild):
+                config = self.load_config(interaction.guild)
+                config["rainfall_thread_channel"] = channel.id
+                self.save_config(interaction.guild, config)
+            await respond.send(f"Rainfall thread channel set to {channel.mention} (ID: {channel.id})")
 
     @app_commands.command(name="add_admin", description="Add a user to the Rainfall Admins list.")
     async def add_admin(self, interaction: discord.Interaction, member: discord.Member):
-        if not await self.has_elevated_perms(interaction.user, interaction.guild):
-            await interaction.response.send_message("You don't have permission to run this.", ephemeral=True)
-            return
+        async with Responder(interaction) as respond:
+            if not await self.has_elevated_perms(interaction.user, interaction.guild):
+                await respond.send("You don't have permission to run this.")
+                return
 
-        config = self.load_config(interaction.guild)
-        admin_list = config.get("rainfall_admins", [])
-        if member.id not in admin_list:
-            admin_list.append(member.id)
-            config["rainfall_admins"] = admin_list
-            self.save_config(interaction.guild, config)
-            await interaction.response.send_message(f"Added {member.display_name} to Rainfall Admins.", ephemeral=True)
-        else:
-            await interaction.response.send_message(f"{member.display_name} is already in Rainfall Admins.", ephemeral=True)
+            async with self.config_lock(interaction.guild):
+                config = self.load_config(interaction.guild)
+                admin_list = config.get("rainfall_admins", [])
+                changed = member.id not in admin_list
+                if changed:
+                    admin_list.append(member.id)
+                    config["rainfall_admins"] = admin_list
+                    self.save_config(interaction.guild, config)
+
+            if changed:
+                await respond.send(f"Added {member.display_name} to Rainfall Admins.")
+            else:
+                await respond.send(f"{member.display_name} is already in Rainfall Admins.")
 
     @app_commands.command(name="remove_admin", description="Remove a user from the Rainfall Admins list.")
     async def remove_admin(self, interaction: discord.Interaction, member: discord.Member):
-        if not await self.has_elevated_perms(interaction.user, interaction.guild):
-            await interaction.response.send_message("You don't have permission to run this.", ephemeral=True)
-            return
+        async with Responder(interaction) as respond:
+            if not await self.has_elevated_perms(interaction.user, interaction.guild):
+                await respond.send("You don't have permission to run this.")
+                return
 
-        config = self.load_config(interaction.guild)
-        admin_list = config.get("rainfall_admins", [])
-        if member.id in admin_list:
-            admin_list.remove(member.id)
-            config["rainfall_admins"] = admin_list
-            self.save_config(interaction.guild, config)
-            await interaction.response.send_message(f"Removed {member.display_name} from Rainfall Admins.", ephemeral=True)
-        else:
-            await interaction.response.send_message(f"{member.display_name} is not in Rainfall Admins.", ephemeral=True)
+            async with self.config_lock(interaction.guild):
+                config = self.load_config(interaction.guild)
+                admin_list = config.get("rainfall_admins", [])
+                changed = member.id in admin_list
+                if changed:
+                    admin_list.remove(member.id)
+                    config["rainfall_admins"] = admin_list
+                    self.save_config(interaction.guild, config)
+
+            if changed:
+                await respond.send(f"Removed {member.display_name} from Rainfall Admins.")
+            else:
+                await respond.send(f"{member.display_name} is not in Rainfall Admins.")
 
     @app_commands.command(name="add_staff", description="Add a staff member to the Rainfall Staff list.")
     async def add_staff(self, interaction: discord.Interaction, member: discord.Member):
-        if not await self.is_admin(interaction.user, interaction.guild):
-            await interaction.response.send_message("Only Rainfall Admins, the guild owner, administrators, or the bot owner can run this.", ephemeral=True)
-            return
+        async with Responder(interaction) as respond:
+            if not await self.is_admin(interaction.user, interaction.guild):
+                await respond.send("Only Rainfall Admins, the guild owner, administrators, or the bot owner can run this.")
+                return
 
-        config = self.load_config(interaction.guild)
-        staff_list = config.get("rainfall_staff", [])
-        if member.id not in staff_list:
-            staff_list.append(member.id)
-            config["rainfall_staff"] = staff_list
-            self.save_config(interaction.guild, config)
-            await interaction.response.send_message(f"Added {member.display_name} to Rainfall Staff.", ephemeral=True)
-        else:
-            await interaction.response.send_message(f"{member.display_name} is already in Rainfall Staff.", ephemeral=True)
+            async with self.config_lock(interaction.guild):
+                config = self.load_config(interaction.guild)
+                staff_list = config.get("rainfall_staff", [])
+                changed = member.id not in staff_list
+                if changed:
+                    staff_list.append(member.id)
+                    config["rainfall_staff"] = staff_list
+                    self.save_config(interaction.guild, config)
+
+            if changed:
+                await respond.send(f"Added {member.display_name} to Rainfall Staff.")
+            else:
+                await respond.send(f"{member.display_name} is already in Rainfall Staff.")
 
     @app_commands.command(name="remove_staff", description="Remove a staff member from the Rainfall Staff list.")
     async def remove_staff(self, interaction: discord.Interaction, member: discord.Member):
-        if not await self.is_admin(interaction.user, interaction.guild):
-            await interaction.response.send_message("Only Rainfall Admins, the guild owner, administrators, or the bot owner can run this.", ephemeral=True)
-            return
+        async with Responder(interaction) as respond:
+            if not await self.is_admin(interaction.user, interaction.guild):
+                await respond.send("Only Rainfall Admins, the guild owner, administrators, or the bot owner can run this.")
+                return
 
-        config = self.load_config(interaction.guild)
-        staff_list = config.get("rainfall_staff", [])
-        if member.id in staff_list:
-            staff_list.remove(member.id)
-            config["rainfall_staff"] = staff_list
-            self.save_config(interaction.guild, config)
-            await interaction.response.send_message(f"Removed {member.display_name} from Rainfall Staff.", ephemeral=True)
-        else:
-            await interaction.response.send_message(f"{member.display_name} is not in Rainfall Staff.", ephemeral=True)
+            async with self.config_lock(interaction.guild):
+                config = self.load_config(interaction.guild)
+                staff_list = config.get("rainfall_staff", [])
+                changed = member.id in staff_list
+                if changed:
+                    staff_list.remove(member.id)
+                    config["rainfall_staff"] = staff_list
+                    self.save_config(interaction.guild, config)
+
+            if changed:
+                await respond.send(f"Removed {member.display_name} from Rainfall Staff.")
+            else:
+                await respond.send(f"{member.display_name} is not in Rainfall Staff.")
 
     @app_commands.command(name="view_config", description="View this guild's Rainfall config.")
     async def view_config(self, interaction: discord.Interaction):
-        if not await self.is_staff(interaction.user, interaction.guild):
-            await interaction.response.send_message("Only Rainfall Staff, Admins, the guild owner, administrators, or the bot owner can run this.", ephemeral=True)
-            return
+        async with Responder(interaction) as respond:
+            if not await self.is_staff(interaction.user, interaction.guild):
+                await respond.send("Only Rainfall Staff, Admins, the guild owner, administrators, or the bot owner can run this.")
+                return
+
+            config = self.load_config(interaction.guild)
+            if not config:
+                await respond.send("No config set for this guild yet.")
+            else:
+                formatted = json.dumps({k: v for k, v in config.items() if not k.startswith("_")}, indent=4)
+                pages = split_pages(formatted, PAGE_BODY_LIMIT)
 
-        config = self.load_config(interaction.guild)
-        if not config:
-            await interaction.response.send_message("No config set for this guild yet.", ephemeral=True)
-        else:
-            formatted = json.dumps(config, indent=4)
-            await interaction.response.send_message(f"```json\n{formatted}\n```", ephemeral=True)
+                async def render(page: int) -> str:
+                    start, end = pages[page]
+                    return f"```json\n{formatted[start:end]}\n```"
+
+                await respond.send_pages(render, len(pages))
 
     @app_commands.command(name="list_staff", description="List all Rainfall Admins and Staff in this guild.")
     async def list_staff(self, interaction: discord.Interaction):
-        if not await self.is_staff(interaction.user, interaction.guild):
-            await interaction.response.send_message("Only Rainfall Staff, Admins, the guild owner, administrators, or the bot owner can run this.", ephemeral=True)
-            return
+        async with Responder(interaction) as respond:
+            if not await self.is_staff(interaction.user, interaction.guild):
+                await respond.send("Only Rainfall Staff, Admins, the guild owner, administrators, or the bot owner can run this.")
+                return
 
-        config = self.load_config(interaction.guild)
-        admin_list = config.get("rainfall_admins", [])
-        staff_list = config.get("rainfall_staff", [])
+            config = self.load_config(interaction.guild)
+            admin_list = config.get("rainfall_admins", [])
+            staff_list = config.get("rainfall_staff", [])
+
+            # headings are strings, everything else is a user id resolved only when its page is shown
+            rows = ["**Rainfall Admins**:", *(admin_list or ["None set"]), "", "**Rainfall Staff**:", *(staff_list or ["None set"])]
+            page_count = -(-len(rows) // STAFF_ROWS_PER_PAGE)
+
+            async def render(page: int) -> str:
+                page_rows = rows[page * STAFF_ROWS_PER_PAGE:(page + 1) * STAFF_ROWS_PER_PAGE]
+                members = await self.resolve_members(interaction.guild, [r for r in page_rows if isinstance(r, int)])
+
+                def resolve_name(row) -> str:
+                    if isinstance(row, str):
+                        return row
+                    member = members.get(row)
+                    return member.display_name if member else f"Unknown User ({row})"
+
+                return "\n".join(resolve_name(row) for row in page_rows)
+
+            await respond.send_pages(render, page_count)
+
+    @app_commands.command(name="ticket_stats", description="View ticket statistics for this guild.")
+    async def ticket_stats(self, interaction: discord.Interaction):
+        async with Responder(interaction) as respond:
+            if not await self.is_staff(interaction.user, interaction.guild):
+                await respond.send("Only Rainfall Staff, Admins, the guild owner, administrators, or the bot owner can run this.")
+                return
+
+            dm_handler = self.bot.get_cog("DMHandler")
+            if not dm_handler:
+                await respond.send("Ticket statistics aren't available right now.")
+                return
+
+            # all aggregates are fixed-size, so this is constant time whatever the ticket volume
+            stats = dm_handler.stats.get(interaction.guild.id)
+            per_day = stats["opened_per_day"]
+            now = time.time()
+
+            def opened(days: int, mode: str) -> int:
+                keys = (time.strftime("%Y-%m-%d", time.gmtime(now - i * 86400)) for i in range(days))
+                return sum(per_day.get(k, {}).get(mode, 0) for k in keys)
+
+            def fmt_duration(seconds: float) -> str:
+                for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+                    if seconds >= size:
+                        return f"{seconds / size:.1f}{unit}"
+                return f"{seconds:.0f}s"
 
-        def resolve_name(uid: int) -> str:
-            member = interaction.guild.get_member(uid)
-            return member.display_name if member else f"Unknown User ({uid})"
+            def fmt_bound(bound: float) -> str:
+                # percentiles are bucket upper bounds, the last bucket is open-ended
+                return f"> {fmt_duration(dm_handler.stats.max_bucket)}" if bound == float("inf") else f"≤ {fmt_duration(bound)}"
 
-        admins_str = "\n".join(resolve_name(uid) for uid in admin_list) if admin_list else "None set"
-        staff_str = "\n".join(resolve_name(uid) for uid in staff_list) if staff_list else "None set"
+            def fmt_histogram(histogram: dict) -> str:
+                if not histogram["count"]:
+                    return "no data"
+                mean = histogram["total"] / histogram["count"]
+                median = dm_handler.stats.percentile(histogram, 0.5)
+                p90 = dm_handler.stats.percentile(histogram, 0.9)
+                return f"median {fmt_bound(median)}, p90 {fmt_bound(p90)}, mean {fmt_duration(mean)} (n={histogram['count']})"
 
-        msg = f"**Rainfall Admins**:\n{admins_str}\n\n**Rainfall Staff**:\n{staff_str}"
-        await interaction.response.send_message(msg, ephemeral=True)
+            lines = ["**Rainfall Ticket Stats**"]
+            for mode in ("anonymous", "identified"):
+                lines.append(
+                    f"\n**{mode.title()}**\n"
+                    f"Open: {stats['open'][mode]}\n"
+                    f"Opened today: {opened(1, mode)}, last 7 days: {opened(7, mode)} ({opened(7, mode) / 7:.1f}/day), "
+                    f"last 30 days: {opened(30, mode)} ({opened(30, mode) / 30:.1f}/day)\n"
+                    f"First staff response: {fmt_histogram(stats['first_response'][mode])}\n"
+                    f"Time to close: {fmt_histogram(stats['time_to_close'][mode])}"
+                )
+            relayed = stats["relayed"]
+            lines.append(f"\nMessages relayed: {relayed['user_to_staff']} to staff, {relayed['staff_to_user']} to users")
+            await respond.send("\n".join(lines))
 
 
 # setup for loading cog
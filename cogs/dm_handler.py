@@ -6,21 +6,187 @@ from discord.ext import commands
 from discord import app_commands
 import os
 import hashlib
+import functools
+import secrets
 import json
-import traceback
+import logging
 import asyncio
+import itertools
+import time
+import bisect
+import io
+import weakref
 from typing import Optional
+from storage import VersionConflict, read_json, write_json_versioned
+from relay_log import RelayLog
+from responder import Responder
+
+log = logging.getLogger("rainfall.dm_handler")
 
 # set directory for user config files
 CONFIG_DIR = "user_configs"
 if not os.path.exists(CONFIG_DIR):
     os.makedirs(CONFIG_DIR)
 
+# per-deployment secret for anonymous hashes, RAINFALL_HASH_KEY or a generated key file
+HASH_KEY_FILE = "hash.key"
+HASH_SCHEME = "blake2b-keyed"
+
+
+def load_hash_key() -> bytes:
+    secret = os.getenv("RAINFALL_HASH_KEY")
+    if secret:
+        # any length of secret works, blake2b keys are capped at 64 bytes
+        return hashlib.blake2b(secret.encode(), digest_size=32).digest()
+    if os.path.exists(HASH_KEY_FILE):
+        with open(HASH_KEY_FILE, "r") as f:
+            return bytes.fromhex(f.read().strip())
+    key = secrets.token_bytes(32)
+    fd = os.open(HASH_KEY_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(key.hex())
+    log.warning("RAINFALL_HASH_KEY not set, generated %s. Back it up, anonymous tickets can't be matched without it.", HASH_KEY_FILE)
+    return key
+
+
+HASH_KEY = load_hash_key()
+
+
 # helper for hashing ids
+@functools.lru_cache(maxsize=4096)
 def hash_user_id(user_id: int) -> str:
-    """Return a hashed representation of the user ID for anonymity."""
+    """Return a keyed hash of the user ID for anonymity."""
+    return hashlib.blake2b(str(user_id).encode(), key=HASH_KEY, digest_size=32).hexdigest()
+
+
+# per guild folder: legacy hashes a full member scan couldn't match, so restarts don't scan again
+LEGACY_SCAN_FILE = "legacy_unmatched.txt"
+
+
+def legacy_hash_user_id(user_id: int) -> str:
+    """Unkeyed hash used before HASH_SCHEME, only for migrating old anonymous tickets."""
     return hashlib.sha256(str(user_id).encode()).hexdigest()
 
+# durable relay log for at-least-once delivery
+RELAY_DIR = "relay_log"
+if not os.path.exists(RELAY_DIR):
+    os.makedirs(RELAY_DIR)
+
+
+class TicketAlreadyOpen(Exception):
+    """Raised when a user opens a ticket in a guild where they already have one with another identity mode."""
+
+
+def relay_key(message: discord.Message) -> str:
+    """Deduplication key for a relay: the source message id, plus the edit time for edits."""
+    if message.edited_at:
+        return f"{message.id}:{int(message.edited_at.timestamp() * 1000)}"
+    return str(message.id)
+
+
+# ticket analytics, kept per guild and flushed to STATS_DIR every STATS_FLUSH_INTERVAL seconds
+STATS_DIR = "ticket_stats"
+if not os.path.exists(STATS_DIR):
+    os.makedirs(STATS_DIR)
+STATS_FLUSH_INTERVAL = 60
+STATS_DAYS = 30
+IDENTITY_MODES = ("anonymous", "identified")
+# histogram bucket upper bounds in seconds, one extra bucket catches everything above
+DURATION_BUCKETS = [60, 300, 900, 3600, 4 * 3600, 12 * 3600, 86400, 3 * 86400, 7 * 86400]
+
+
+class TicketStats:
+    """Rolling per-guild ticket counters and duration histograms, updated as events happen
+    so reading them never touches ticket storage. Everything is fixed-size."""
+
+    # largest finite bucket bound, anything above lands in the overflow bucket
+    max_bucket = DURATION_BUCKETS[-1]
+
+    def __init__(self):
+        self.guilds: dict[int, dict] = {}
+        self.dirty: set[int] = set()
+
+    @staticmethod
+    def empty_histogram() -> dict:
+        return {"buckets": [0] * (len(DURATION_BUCKETS) + 1), "count": 0, "total": 0.0}
+
+    def get(self, guild_id: int) -> dict:
+        stats = self.guilds.get(guild_id)
+        if stats is None:
+            stats = {
+                "open": {m: 0 for m in IDENTITY_MODES},
+                "opened_per_day": {},
+                "first_response": {m: self.empty_histogram() for m in IDENTITY_MODES},
+                "time_to_close": {m: self.empty_histogram() for m in IDENTITY_MODES},
+                "relayed": {"user_to_staff": 0, "staff_to_user": 0},
+            }
+            try:
+                stats.update(read_json(os.path.join(STATS_DIR, f"{guild_id}.json")))
+            except Exception:
+                log.warning("Unreadable ticket stats, starting fresh", extra={"guild": guild_id})
+            self.guilds[guild_id] = stats
+        return stats
+
+    def observe(self, histogram: dict, seconds: float):
+        seconds = max(0.0, seconds)
+        histogram["buckets"][bisect.bisect_left(DURATION_BUCKETS, seconds)] += 1
+        histogram["count"] += 1
+        histogram["total"] += seconds
+
+    @staticmethod
+    def percentile(histogram: dict, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile, inf for the overflow bucket."""
+        if not histogram["count"]:
+            return None
+        target = p * histogram["count"]
+        seen = 0
+        for bound, count in zip(DURATION_BUCKETS + [float("inf")], histogram["buckets"]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    # ----- events -----
+    def ticket_opened(self, guild_id: int, mode: str, now: float):
+        stats = self.get(guild_id)
+        stats["open"][mode] += 1
+        per_day = stats["opened_per_day"]
+        day = time.strftime("%Y-%m-%d", time.gmtime(now))
+        per_day.setdefault(day, {m: 0 for m in IDENTITY_MODES})[mode] += 1
+        while len(per_day) > STATS_DAYS:
+            del per_day[min(per_day)]
+        self.dirty.add(guild_id)
+
+    def first_response(self, guild_id: int, mode: str, seconds: float):
+        self.observe(self.get(guild_id)["first_response"][mode], seconds)
+        self.dirty.add(guild_id)
+
+    def ticket_closed(self, guild_id: int, mode: str, seconds: float):
+        stats = self.get(guild_id)
+        stats["open"][mode] = max(0, stats["open"][mode] - 1)
+        self.observe(stats["time_to_close"][mode], seconds)
+        self.dirty.add(guild_id)
+
+    def relayed(self, guild_id: int, direction: str):
+        self.get(guild_id)["relayed"][direction] += 1
+        self.dirty.add(guild_id)
+
+    # ----- persistence -----
+    def flush(self):
+        for guild_id in list(self.dirty):
+            try:
+                write_json_versioned(os.path.join(STATS_DIR, f"{guild_id}.json"), self.guilds[guild_id])
+            except Exception:
+                log.exception("Failed to save ticket stats", extra={"guild": guild_id})
+                continue
+            self.dirty.discard(guild_id)
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            self.flush()
+
+
 # Intial setup, recovery and configuration
 class DMHandler(commands.Cog):
     def __init__(self, bot: commands.Bot):
@@ -29,6 +195,43 @@ class DMHandler(commands.Cog):
         self.awaiting_identity: dict[int, dict] = {}
         # runtime only: hash -> user
         self.anon_sessions: dict[str, discord.User] = {}
+        # thread_id -> DM channel id, so staff replies skip the create_dm round trip
+        # identified tickets also persist it as `dm_channel_id`, anonymous ones stay runtime only
+        self.dm_channels: dict[int, int] = {}
+        # startup jobs (DM channel warmup, hash migration, stats flushing, relay retries) by name
+        self.background_tasks: dict[str, asyncio.Task] = {}
+        self.stats = TicketStats()
+        self.relay_log = RelayLog(os.path.join(RELAY_DIR, "relay.log"))
+        # (guild_id, user_id) -> lock around ticket read-modify-write, dropped once unused
+        self.ticket_locks: weakref.WeakValueDictionary[tuple[int, int], asyncio.Lock] = weakref.WeakValueDictionary()
+
+    async def cog_load(self):
+        # on_ready won't fire again if the cog is (re)loaded into a running bot
+        if self.bot.is_ready():
+            self.start_background_tasks()
+
+    async def cog_unload(self):
+        for task in self.background_tasks.values():
+            task.cancel()
+        self.stats.flush()
+        # listeners are already removed, but relays they started may still be sending
+        await self.relay_log.close()
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        self.start_background_tasks()
+
+    def start_background_tasks(self):
+        jobs = (
+            ("dm_warmup", self.warm_dm_channels),
+            ("hash_migration", self.migrate_anonymous_hashes),
+            ("stats_flush", self.stats.flush_periodically),
+            ("relay_retry", lambda: self.relay_log.retry_worker(self.redeliver)),
+        )
+        for name, job in jobs:
+            task = self.background_tasks.get(name)
+            if task is None or task.done():
+                self.background_tasks[name] = asyncio.create_task(job())
 
     # ─── User Config ───
     def get_guild_dir(self, guild_id: int) -> str:
@@ -77,12 +280,47 @@ class DMHandler(commands.Cog):
                 self.anon_sessions[config["user_hash"]] = user
                 return config
 
+            if (
+                config.get("identity_mode") == "anonymous"
+                and config.get("hash_scheme") != HASH_SCHEME
+                and config.get("user_hash") == legacy_hash_user_id(user.id)
+            ):
+                config["_config_path"] = path
+                return self.rekey_anonymous_config(guild_id, user, config)
+
         return {}
 
+    def rekey_anonymous_config(self, guild_id: int, user: discord.User, config: dict) -> dict:
+        """Move a legacy anonymous ticket over to the keyed hash (new user_hash and file name)."""
+        old_path = config["_config_path"]
+        rekeyed = {k: v for k, v in config.items() if k != "_version"}
+        rekeyed["user_hash"] = hash_user_id(user.id)
+        rekeyed["hash_scheme"] = HASH_SCHEME
+        rekeyed.pop("_config_path")
+        try:
+            # no _config_path: this creates the keyed file fresh
+            self.save_user_config(guild_id, user, rekeyed)
+        except VersionConflict:
+            return config  # a keyed file already exists, leave both for now
+        os.remove(old_path)
+        rekeyed["_config_path"] = self.get_user_config_path(guild_id, user, "anonymous")
+        return rekeyed
+
+    def ticket_lock(self, guild_id: int, user: discord.User) -> asyncio.Lock:
+        """Per-ticket lock, hold it across load_user_config -> save_user_config/delete_user_config."""
+        key = (guild_id, user.id)
+        lock = self.ticket_locks.get(key)
+        if lock is None:
+            lock = self.ticket_locks[key] = asyncio.Lock()
+        return lock
+
     def save_user_config(self, guild_id: int, user: discord.User, data: dict):
-        """Saves the provided data to disk (never stores raw IDs for anonymous users)."""
+        """Saves the provided data to disk (never stores raw IDs for anonymous users).
+        Raises storage.VersionConflict if the ticket changed or was deleted since `data` was loaded."""
         to_save = dict(data)
-        if "_config_path" in to_save:
+        # data carrying its path was loaded from disk, so the file must still be there
+        loaded = "_config_path" in to_save
+        if loaded:
             path = to_save.pop("_config_path")
         else:
             identity_mode = to_save.get("identity_mode", "identified")
@@ -92,69 +330,366 @@ class DMHandler(commands.Cog):
         if to_save.get("identity_mode") == "anonymous":
             user_hash = hash_user_id(user.id)
             to_save["user_hash"] = user_hash
+            to_save["hash_scheme"] = HASH_SCHEME
             self.anon_sessions[user_hash] = user
             to_save.pop("original_user_id", None)  # ensure no raw ID leaks
+            to_save.pop("dm_channel_id", None)  # a DM channel resolves to the user, so it counts as a raw ID
 
-        with open(path, "w") as f:
-            json.dump(to_save, f, indent=4)
+        write_json_versioned(path, to_save, must_exist=loaded)
+        data["_version"] = to_save["_version"]
 
     def delete_user_config(self, guild_id: int, user: discord.User):
         config = self.load_user_config(guild_id, user)
         path = config.get("_config_path")
         if path and os.path.exists(path):
             os.remove(path)
+        self.dm_channels.pop(config.get("thread_id"), None)
+
+    # ─── DM channel cache ───
+    def remember_dm_channel(self, guild_id: int, user: discord.User, config: dict, channel_id: int):
+        """Cache the DM channel for a ticket, persisting it for identified tickets that don't have it yet."""
+        self.dm_channels[config.get("thread_id")] = channel_id
+        if config.get("identity_mode") == "identified" and config.get("dm_channel_id") != channel_id:
+            config["dm_channel_id"] = channel_id
+            try:
+                self.save_user_config(guild_id, user, config)
+            except VersionConflict:
+                pass  # the ticket changed underneath us, it'll be persisted on a later message
+
+    async def warm_dm_channels(self):
+        """Background task: make sure every open identified ticket has a known DM channel."""
+        for guild_folder in os.listdir(CONFIG_DIR):
+            guild_dir = os.path.join(CONFIG_DIR, guild_folder)
+            if not os.path.isdir(guild_dir) or not guild_folder.isdigit():
+                continue
+            for file in os.listdir(guild_dir):
+                if not file.endswith(".json"):
+                    continue
+                path = os.path.join(guild_dir, file)
+                try:
+                    with open(path, "r") as f:
+                        config = json.load(f)
+                except Exception:
+                    continue
+                if not config.get("ticket_open", False) or config.get("identity_mode") != "identified":
+                    continue
+                if config.get("dm_channel_id"):
+                    self.dm_channels[config.get("thread_id")] = config["dm_channel_id"]
+                    continue
+                try:
+                    user_id = int(file.split(".")[0])
+                    user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+                    channel = user.dm_channel or await user.create_dm()
+                except Exception:
+                    log.warning("Failed to warm DM channel", extra={"ticket": config.get("thread_id"), "guild": guild_folder})
+                    continue
+                async with self.ticket_lock(int(guild_folder), user):
+                    # re-read under the lock, the ticket may have changed or closed during the awaits above
+                    try:
+                        config = read_json(path)
+                    except Exception:
+                        continue
+                    if not config.get("ticket_open", False):
+                        continue
+                    config["_config_path"] = path
+                    self.remember_dm_channel(int(guild_folder), user, config, channel.id)
+            # the scan is synchronous, so give the loop a chance between guilds
+            await asyncio.sleep(0)
+
+    # ─── Relaying ───
+    async def resolve_ticket_recipient(self, guild_id: int, thread_id: int):
+        """Find the open ticket for a staff thread and where replies to it go.
+        Returns (ticket_config, destination, target_user), any of which may be None."""
+        target_user = None
+        dm_channel_id = None
+        ticket_config = None
+        guild_dir = self.get_guild_dir(guild_id)
+        for file in os.listdir(guild_dir):
+            if not file.endswith(".json"):
+                continue
+            with open(os.path.join(guild_dir, file), "r") as f:
+                try:
+                    uconf = json.load(f)
+                except Exception:
+                    continue
+            if uconf.get("thread_id") != thread_id or not uconf.get("ticket_open", False):
+                continue
+            ticket_config = uconf
+            ticket_config["_config_path"] = os.path.join(guild_dir, file)
+            dm_channel_id = self.dm_channels.get(thread_id) or uconf.get("dm_channel_id")
+            if dm_channel_id:
+                break
+            if uconf.get("identity_mode") == "anonymous":
+                target_user = self.anon_sessions.get(uconf.get("user_hash"))
+            else:
+                try:
+                    user_id = int(file.split(".")[0])
+                    # users aren't guaranteed to be cached when the member cache is restricted
+                    target_user = self.bot.get_user(user_id) or await self.bot.fetch_user(user_id)
+                except Exception:
+                    target_user = None
+            if target_user:
+                break
+
+        destination = target_user
+        if dm_channel_id:
+            # sending to a partial channel is a single REST call, no create_dm needed
+            destination = self.bot.get_partial_messageable(dm_channel_id, type=discord.ChannelType.private)
+        return ticket_config, destination, target_user
+
+    def after_relay(self, entry: dict, ticket_config: Optional[dict] = None, target_user: Optional[discord.User] = None):
+        """Bookkeeping once a relay was delivered. Staff relays pass the ticket and recipient from resolve_ticket_recipient."""
+        if entry["direction"] == "user_to_staff":
+            self.stats.relayed(entry["guild"], "user_to_staff")
+            return
+        if target_user and target_user.dm_channel:
+            self.remember_dm_channel(entry["guild"], target_user, ticket_config, target_user.dm_channel.id)
+        self.stats.relayed(entry["guild"], "staff_to_user")
+        self.record_first_response(entry["guild"], ticket_config)
+
+    async def relay(
+        self, message: discord.Message, destination: Optional[discord.abc.Messageable], content: Optional[str],
+        direction: str, guild_id: int, ticket_id: int, source_channel: Optional[int],
+        ticket_config: Optional[dict] = None, target_user: Optional[discord.User] = None,
+    ) -> bool:
+        """Relay a message through the relay log: recorded before sending so a failure or restart can't lose it,
+        acknowledged once sent, otherwise left to the retry worker. A None destination is retried until reachable.
+        Returns False if the message was already relayed, e.g. the gateway replayed the event."""
+        entry = self.relay_log.record(
+            relay_key(message),
+            direction=direction,
+            guild=guild_id,
+            ticket=ticket_id,
+            content=content,
+            embeds=[e.to_dict() for e in message.embeds],
+            attachments=[a.url for a in message.attachments],
+            source_channel=source_channel,
+            source_message=message.id,
+        )
+        if entry is None:
+            return False
+        if destination is None:
+            # e.g. an anonymous user nobody has heard from since a restart, retried until they DM
+            self.relay_log.retry(entry)
+            return True
+        try:
+            files = [await a.to_file() for a in message.attachments] if message.attachments else None
+            await destination.send(content=content, files=files, embeds=message.embeds or None)
+        except Exception:
+            log.exception("Failed to relay message, will retry", extra={"ticket": ticket_id, "guild": guild_id, "direction": direction})
+            self.relay_log.retry(entry)
+            return True
+        self.relay_log.ack(entry)
+        self.after_relay(entry, ticket_config, target_user)
+        # react to the original message after successful send
+        try:
+            await message.add_reaction("📩")
+        except discord.HTTPException:
+            pass
+        return True
+
+    async def redeliver(self, entry: dict) -> bool:
+        """Retry a relay from the relay log. False means the ticket is gone and the entry can be dropped."""
+        guild = self.bot.get_guild(entry["guild"])
+        if not guild:
+            return False
+        ticket_config, target_user = None, None
+        if entry["direction"] == "user_to_staff":
+            destination = guild.get_thread(entry["ticket"])
+            if not destination:
+                return False
+        else:
+            ticket_config, destination, target_user = await self.resolve_ticket_recipient(guild.id, entry["ticket"])
+            if not ticket_config:
+                return False
+            if destination is None:
+                raise LookupError("ticket recipient isn't reachable yet")
+
+        files = []
+        for url in entry.get("attachments", []):
+            data = await self.bot.http.get_from_cdn(url)
+            files.append(discord.File(io.BytesIO(data), filename=url.split("?")[0].rsplit("/", 1)[-1]))
+        embeds = [discord.Embed.from_dict(e) for e in entry.get("embeds", [])]
+        await destination.send(content=entry.get("content"), files=files or None, embeds=embeds or None)
+
+        self.after_relay(entry, ticket_config, target_user)
+        if entry.get("source_channel"):
+            try:
+                source = self.bot.get_partial_messageable(entry["source_channel"]).get_partial_message(entry["source_message"])
+                await source.add_reaction("📩")
+            except discord.HTTPException:
+                pass
+        return True
+
+    # ─── Analytics ───
+    def record_first_response(self, guild_id: int, config: dict):
+        """Count the first staff reply on a ticket, marking the ticket file so it's only counted once."""
+        if not config.get("opened_at") or config.get("first_response_at"):
+            return
+        now = time.time()
+        config["first_response_at"] = now
+        to_save = {k: v for k, v in config.items() if k != "_config_path"}
+        try:
+            write_json_versioned(config["_config_path"], to_save, must_exist=True)
+        except VersionConflict:
+            return  # the ticket changed underneath us, the next reply will count it
+        config["_version"] = to_save["_version"]
+        self.stats.first_response(guild_id, config.get("identity_mode"), now - config["opened_at"])
+
+    # ─── Anonymous hash migration ───
+    async def migrate_anonymous_hashes(self):
+        """Background task: re-key legacy (unkeyed SHA-256) anonymous tickets one file at a time.
+        Users are matched against the bot's cache, then the members of each guild with legacy tickets.
+        Anyone still unmatched is recorded in LEGACY_SCAN_FILE and re-keyed on their next DM."""
+        known_users = None
+        migrated, pending = 0, 0
+        for guild_folder in os.listdir(CONFIG_DIR):
+            guild_dir = os.path.join(CONFIG_DIR, guild_folder)
+            if not os.path.isdir(guild_dir) or not guild_folder.isdigit():
+                continue
+            # path -> legacy user hash
+            legacy = {}
+            for file in os.listdir(guild_dir):
+                if not file.endswith(".json"):
+                    continue
+                path = os.path.join(guild_dir, file)
+                try:
+                    config = read_json(path)
+                except Exception:
+                    continue
+                if config.get("identity_mode") != "anonymous" or config.get("hash_scheme") == HASH_SCHEME:
+                    continue
+                legacy[path] = config.get("user_hash")
+            if not legacy:
+                continue
+
+            if known_users is None:
+                # only built once there is something to migrate
+                known_users = {
+                    legacy_hash_user_id(u.id): u
+                    for u in itertools.chain(self.bot.users, self.anon_sessions.values())
+                }
+            users = {h: known_users[h] for h in legacy.values() if h in known_users}
+            # the user cache is nearly empty without a member cache, so page through the guild's members,
+            # unless an earlier scan already came up empty for every hash still left
+            wanted = set(legacy.values()) - users.keys()
+            scan_path = os.path.join(guild_dir, LEGACY_SCAN_FILE)
+            if os.path.exists(scan_path):
+                with open(scan_path, "r") as f:
+                    wanted -= set(f.read().split())
+            guild = self.bot.get_guild(int(guild_folder))
+            if wanted and guild:
+                try:
+                    async for member in guild.fetch_members(limit=None):
+                        member_hash = legacy_hash_user_id(member.id)
+                        if member_hash in wanted:
+                            users[member_hash] = member
+                            wanted.discard(member_hash)
+                            if not wanted:
+                                break
+                except (discord.HTTPException, discord.ClientException):
+                    log.warning("Could not fetch members to match legacy anonymous tickets", exc_info=True, extra={"guild": guild.id})
+                else:
+                    # the scan finished, whoever is left isn't in the guild anymore
+                    unmatched = set(legacy.values()) - users.keys()
+                    with open(scan_path, "w") as f:
+                        f.write("\n".join(sorted(h for h in unmatched if h)))
+
+            for path, user_hash in legacy.items():
+                user = users.get(user_hash)
+                if user is None:
+                    pending += 1
+                    continue
+
+                async with self.ticket_lock(int(guild_folder), user):
+                    # re-read under the lock, the ticket may have changed or closed meanwhile
+                    if not os.path.exists(path):
+                        continue
+                    config = read_json(path)
+                    if config.get("hash_scheme") == HASH_SCHEME:
+                        continue
+                    config["_config_path"] = path
+                    self.rekey_anonymous_config(int(guild_folder), user, config)
+                migrated += 1
+                await asyncio.sleep(0)
+
+        if migrated or pending:
+            log.info("Re-keyed %d anonymous tickets, %d wait for their user's next DM", migrated, pending)
 
     # Ticket thread creation
     async def create_ticket_thread(
         self, user: discord.User, guild: discord.Guild, identity_mode: str
-    ) -> Optional[discord.Thread]:
+    ) -> tuple[Optional[discord.Thread], bool]:
+        """Return (thread, created). If the user already has an open ticket in this guild its thread
+        is returned with created=False, or TicketAlreadyOpen is raised if it has another identity mode."""
         config_manager = self.bot.get_cog("ConfigManager")
         if not config_manager:
-            return None
+            return None, False
 
         config = config_manager.load_config(guild)
         thread_channel_id = config.get("rainfall_thread_channel")
         if not thread_channel_id:
-            return None
+            return None, False
 
         try:
             thread_channel_id = int(thread_channel_id)
         except Exception:
-            return None
+            return None, False
 
         channel = guild.get_channel(thread_channel_id)
         if not channel or not isinstance(channel, discord.TextChannel):
-            return None
-
-        if identity_mode == "anonymous":
-            thread_name = "Anonymous Ticket"
-        else:
-            member = guild.get_member(user.id)
-            display_name = member.display_name if member else user.name
-            thread_name = f"{display_name}'s Ticket"
-
-        try:
-            thread = await channel.create_thread(
-                name=thread_name, type=discord.ChannelType.public_thread
-            )
-        except Exception as e:
-            print(f"[DMHandler] Failed to create thread: {e}")
-            traceback.print_exc()
-            return None
-
-        user_config = {
-            "ticket_open": True,
-            "identity_mode": identity_mode,
-            "thread_id": thread.id,
-            "guild_id": guild.id,
-        }
-        if identity_mode == "anonymous":
-            user_hash = hash_user_id(user.id)
-            user_config["user_hash"] = user_hash
-            self.anon_sessions[user_hash] = user
+            return None, False
+
+        # two concurrent opens for the same user must not both create a thread
+        async with self.ticket_lock(guild.id, user):
+            existing = self.load_user_config(guild.id, user)
+            if existing.get("ticket_open", False):
+                thread = guild.get_thread(existing.get("thread_id"))
+                if thread:
+                    # e.g. two prompts answered differently, never link an anonymous ticket to a name
+                    if existing.get("identity_mode") != identity_mode:
+                        raise TicketAlreadyOpen(guild.id)
+                    return thread, False
+            if existing:
+                # leftover of a ticket that never finished closing or whose thread is gone
+                if existing.get("ticket_open", False) and existing.get("opened_at"):
+                    self.stats.ticket_closed(guild.id, existing.get("identity_mode"), time.time() - existing["opened_at"])
+                os.remove(existing["_config_path"])
+
+            if identity_mode == "anonymous":
+                thread_name = "Anonymous Ticket"
+            else:
+                member = await config_manager.resolve_member(guild, user.id)
+                display_name = member.display_name if member else user.name
+                thread_name = f"{display_name}'s Ticket"
 
-        self.save_user_config(guild.id, user, user_config)
-        return thread
+            try:
+                thread = await channel.create_thread(
+                    name=thread_name, type=discord.ChannelType.public_thread
+                )
+            except Exception:
+                log.exception("Failed to create thread", extra={"guild": guild.id})
+                return None, False
+
+            opened_at = time.time()
+            user_config = {
+                "ticket_open": True,
+                "identity_mode": identity_mode,
+                "thread_id": thread.id,
+                "guild_id": guild.id,
+                "opened_at": opened_at,
+            }
+            if identity_mode == "anonymous":
+                user_hash = hash_user_id(user.id)
+                user_config["user_hash"] = user_hash
+                self.anon_sessions[user_hash] = user
+            if user.dm_channel:
+                self.dm_channels[thread.id] = user.dm_channel.id
+                user_config["dm_channel_id"] = user.dm_channel.id
+
+            self.save_user_config(guild.id, user, user_config)
+            self.stats.ticket_opened(guild.id, identity_mode, opened_at)
+            return thread, True
 
     def mark_ticket_closed(self, guild_id: int, user: discord.User):
         config = self.load_user_config(guild_id, user)
@@ -175,33 +710,37 @@ class DMHandler(commands.Cog):
                     await thread.send("This ticket has been closed by the user.")
                     await thread.edit(archived=True)
                 except discord.Forbidden:
-                    print(f"[DMHandler] Missing permissions to archive {thread_id}")
+                    log.warning("Missing permissions to archive thread", extra={"ticket": thread_id, "guild": guild_id})
                 except Exception:
-                    traceback.print_exc()
+                    log.exception("Failed to close ticket thread", extra={"ticket": thread_id, "guild": guild_id})
 
     # Close ticket slash command
     @app_commands.command(name="closeticket", description="Close your open ticket with the bot.")
     async def closeticket(self, interaction: discord.Interaction):
-        if interaction.guild is not None:
-            await interaction.response.send_message(
-                "This command can only be used in DMs.", ephemeral=True
-            )
-            return
+        # closing walks every guild and messages threads, it never fits in the response window
+        async with Responder(interaction, defer_after=0) as respond:
+            if interaction.guild is not None:
+                await respond.send("This command can only be used in DMs.")
+                return
 
-        user = interaction.user
-        closed_any = False
-        for guild in self.bot.guilds:
-            config = self.load_user_config(guild.id, user)
-            if config and config.get("ticket_open", False):
-                self.mark_ticket_closed(guild.id, user)
-                await self.send_ticket_closed_message(guild.id, user)
-                self.delete_user_config(guild.id, user)
-                closed_any = True
-
-        if closed_any:
-            await interaction.response.send_message("Your ticket has been closed.", ephemeral=True)
-        else:
-            await interaction.response.send_message("You don’t have any open tickets.", ephemeral=True)
+            user = interaction.user
+            closed_any = False
+            for guild in self.bot.guilds:
+                async with self.ticket_lock(guild.id, user):
+                    config = self.load_user_config(guild.id, user)
+                    if config and config.get("ticket_open", False):
+                        # tickets opened before analytics existed were never counted as open
+                        if config.get("opened_at"):
+                            self.stats.ticket_closed(guild.id, config.get("identity_mode"), time.time() - config["opened_at"])
+                        self.mark_ticket_closed(guild.id, user)
+                        await self.send_ticket_closed_message(guild.id, user)
+                        self.delete_user_config(guild.id, user)
+                        closed_any = True
+
+            if closed_any:
+                await respond.send("Your ticket has been closed.")
+            else:
+                await respond.send("You don’t have any open tickets.")
 
     # message proxying
     @commands.Cog.listener()
@@ -220,29 +759,24 @@ class DMHandler(commands.Cog):
                         thread = guild.get_thread(config.get("thread_id"))
                         if not thread:
                             continue
+                        if self.dm_channels.get(thread.id) != message.channel.id:
+                            self.remember_dm_channel(guild.id, user, config, message.channel.id)
                         identity_prefix = (
                             "Anonymous User" if config.get("identity_mode") == "anonymous" else user.name
                         )
-                        files = [await a.to_file() for a in message.attachments] if message.attachments else None
                         if previousMessage:
                             content = f"**{identity_prefix}:** ~~{previousMessage.content}~~\n\n{message.content}" if previousMessage.content else None
                         else: 
                             content = f"**{identity_prefix}:** {message.content}" if message.content else None
-                        embeds = message.embeds if message.embeds else None
                         if message.stickers:
                             names = ", ".join(s.name for s in message.stickers)
                             content = f"{content}\n[Sticker(s): {names}]" if content else f"[Sticker(s): {names}]"
-                        try:
-                            # send to staff thread first
-                            await thread.send(content=content, files=files, embeds=embeds)
-                            # react to the original DM message after successful send
-                            try:
-                                await message.add_reaction("📩")
-                            except discord.HTTPException:
-                                pass
-                        except Exception:
-                            traceback.print_exc()
                         found_ticket = True
+                        await self.relay(
+                            message, thread, content, "user_to_staff", guild.id, thread.id,
+                            # a DM channel resolves to the user, so anonymous relays don't keep it
+                            source_channel=message.channel.id if config.get("identity_mode") != "anonymous" else None,
+                        )
                         break
 
                 if not found_ticket:
@@ -257,58 +791,29 @@ class DMHandler(commands.Cog):
                             "message": message,
                         }
                     except discord.Forbidden:
-                        print(f"[DMHandler] Cannot DM {user}")
+                        log.warning("Cannot DM user for identity prompt")
                     except Exception:
-                        traceback.print_exc()
+                        log.exception("Failed to send identity prompt")
 
             # Staff thread
             else:
                 if message.channel.type in [discord.ChannelType.public_thread, discord.ChannelType.private_thread]:
                     thread = message.channel
                     guild_id = thread.guild.id
-                    target_user = None
-                    guild_dir = self.get_guild_dir(guild_id)
-                    for file in os.listdir(guild_dir):
-                        if not file.endswith(".json"):
-                            continue
-                        with open(os.path.join(guild_dir, file), "r") as f:
-                            try:
-                                uconf = json.load(f)
-                            except Exception:
-                                continue
-                        if uconf.get("thread_id") != thread.id or not uconf.get("ticket_open", False):
-                            continue
-                        if uconf.get("identity_mode") == "anonymous":
-                            target_user = self.anon_sessions.get(uconf.get("user_hash"))
-                        else:
-                            try:
-                                target_user = self.bot.get_user(int(file.split(".")[0]))
-                            except Exception:
-                                target_user = None
-                        if target_user:
-                            break
-
-                    if target_user:
-                        files = [await a.to_file() for a in message.attachments] if message.attachments else None
+                    ticket_config, destination, target_user = await self.resolve_ticket_recipient(guild_id, thread.id)
+
+                    if ticket_config:
                         content = f"**{message.author.display_name}:** {message.content}" if message.content else None
-                        embeds = message.embeds if message.embeds else None
                         if message.stickers:
                             names = ", ".join(s.name for s in message.stickers)
                             content = f"{content}\n[Sticker(s): {names}]" if content else f"[Sticker(s): {names}]"
-                        try:
-                            # send to the target user's DM first
-                            await target_user.send(content=content, files=files, embeds=embeds)
-                            # react to the original staff thread message after successful send
-                            try:
-                                await message.add_reaction("📩")
-                            except discord.HTTPException:
-                                pass
-                        except Exception:
-                            traceback.print_exc()
-
-        except Exception as e:
-            print(f"[DMHandler Error] {e}")
-            traceback.print_exc()
+                        await self.relay(
+                            message, destination, content, "staff_to_user", guild_id, thread.id,
+                            source_channel=thread.id, ticket_config=ticket_config, target_user=target_user,
+                        )
+
+        except Exception:
+            log.exception("Unhandled error in on_message")
 
     @commands.Cog.listener()
     async def on_message_edit(self, before: discord.Message, after: discord.Message):
@@ -336,12 +841,15 @@ class IdentityChoiceView(discord.ui.View):
                 f"You chose **{mode.title()}**. Creating your ticket...", ephemeral=True
             )
             mutual_guilds = []
-            for guild in self.user.mutual_guilds:
-                config_manager = self.handler.bot.get_cog("ConfigManager")
-                if config_manager:
-                    conf = config_manager.load_config(guild)
-                    if conf.get("rainfall_thread_channel"):
-                        mutual_guilds.append(guild)
+            config_manager = self.handler.bot.get_cog("ConfigManager")
+            if config_manager:
+                candidates = [g for g in self.handler.bot.guilds if config_manager.load_config(g).get("rainfall_thread_channel")]
+                # mutual_guilds only sees cached members, guilds without a complete cache (low-memory mode) are asked
+                cached = set(self.user.mutual_guilds)
+                to_query = [g for g in candidates if g not in cached and not g.chunked]
+                found = await asyncio.gather(*(config_manager.resolve_member(g, self.user.id) for g in to_query))
+                queried = {g for g, member in zip(to_query, found) if member}
+                mutual_guilds = [g for g in candidates if g in cached or g in queried]
 
             if not mutual_guilds:
                 await self.user.send("I couldn’t find any servers where you can open a ticket.")
@@ -356,33 +864,35 @@ class IdentityChoiceView(discord.ui.View):
                 else:
                     await self.user.send("No servers available to select for your ticket.")
         except Exception:
-            traceback.print_exc()
+            log.exception("Failed to handle identity choice")
 
     async def create_ticket_in_guild(self, mode: str, guild: discord.Guild):
         try:
-            thread = await self.handler.create_ticket_thread(self.user, guild, mode)
+            try:
+                thread, created = await self.handler.create_ticket_thread(self.user, guild, mode)
+            except TicketAlreadyOpen:
+                await self.user.send(f"You already have an open ticket in **{guild.name}**. Close it with `/closeticket` before opening a {mode} one.")
+                return
             if not thread:
                 await self.user.send(f"Could not create a ticket in {guild.name}.")
                 return
-            await thread.send(f"📩 New {mode.title()} Ticket opened.")
+            if created:
+                await thread.send(f"📩 New {mode.title()} Ticket opened.")
             identity_prefix = "Anonymous User" if mode == "anonymous" else self.user.name
             msg = self.first_message
-            files = [await a.to_file() for a in msg.attachments] if msg.attachments else None
             content = f"**{identity_prefix}:** {msg.content}" if msg.content else None
-            embeds = msg.embeds if msg.embeds else None
             if msg.stickers:
                 names = ", ".join(s.name for s in msg.stickers)
                 content = f"{content}\n[Sticker(s): {names}]" if content else f"[Sticker(s): {names}]"
             # send the user's original message into the thread
-            await thread.send(content=content, files=files, embeds=embeds)
-            # react to the ORIGINAL DM message after successful send into thread
-            try:
-                await self.first_message.add_reaction("📩")
-            except discord.HTTPException:
-                pass
-            await self.user.send(f"Your {mode} ticket has been created in **{guild.name}**. Please be aware that edits to messages are not carried over.")
+            await self.handler.relay(
+                msg, thread, content, "user_to_staff", guild.id, thread.id,
+                source_channel=msg.channel.id if mode != "anonymous" else None,
+            )
+            if created:
+                await self.user.send(f"Your {mode} ticket has been created in **{guild.name}**. Please be aware that edits to messages are not carried over.")
         except Exception:
-            traceback.print_exc()
+            log.exception("Failed to create ticket", extra={"guild": guild.id})
 
 
 # Server picker for ticket
@@ -414,7 +924,7 @@ class GuildChoiceView(discord.ui.View):
             else:
                 await self.user.send("Could not find that server.")
         except Exception:
-            traceback.print_exc()
+            log.exception("Failed to handle guild choice")
 
 
 # setup for loading cog
@@ -4,16 +4,24 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
+from rainfall_logging import setup_logging
 import os
 import sys
 import asyncio
-import traceback
+import logging
+import io
+import cProfile
+import pstats
+import tracemalloc
 
 # Load .env file
 load_dotenv()
+setup_logging(os.getenv("RAINFALL_LOG_LEVEL", "INFO"))
+log = logging.getLogger("rainfall")
+
 TOKEN = os.getenv("RAINFALLTOKEN")
 if not TOKEN:
-    print("ERROR: RAINFALLTOKEN not found in environment. Set it in your .env or environment variables.")
+    log.error("RAINFALLTOKEN not found in environment. Set it in your .env or environment variables.")
     sys.exit(1)
 
 # Set config directory
@@ -22,6 +30,11 @@ CONFIG_DIR = "guild_configs"
 # Store cog: error message for failed loads
 FAILED_COGS = {}
 
+# Profiler limits, only one profiling session may run at a time
+PROFILE_MAX_SECONDS = 300
+PROFILE_TOP_N = 30
+PROFILE_LOCK = asyncio.Lock()
+
 # Set directory info for cogs
 SCRIPT_DIR = os.path.dirname(os.path.realpath(__file__))  # directory of rainfall.py
 COGS_DIR = os.path.join(SCRIPT_DIR, "cogs")  # directory of cogs relative to rainfall.py
@@ -39,7 +52,17 @@ intents.guild_messages = True
 description = '''I help users get in contact with staff members! Shoot me a DM to get started! If you do not feel comfortable identifying yourself
 to staffers, you may elect to anonymously send messages. Maintained by Sadie [@StylisticallyCatgirl].'''
 
-bot = commands.Bot(command_prefix='r;', description=description, intents=intents)
+# Low-memory mode: don't download every member of every guild at startup or keep them cached.
+# Members are resolved on demand instead (see ConfigManager.resolve_members).
+LOW_MEMORY = os.getenv("RAINFALL_LOW_MEMORY", "").lower() in ("1", "true", "yes")
+member_options = {}
+if LOW_MEMORY:
+    member_options = {
+        "chunk_guilds_at_startup": False,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+    }
+
+bot = commands.Bot(command_prefix='r;', description=description, intents=intents, **member_options)
 
 
 # Initialization
@@ -48,18 +71,18 @@ async def on_ready():
     try:
         # Sync slash commands globally
         global_commands = await bot.tree.sync()
-        print(f"Synced {len(global_commands)} commands globally.")
+        log.info("Synced %d commands globally.", len(global_commands))
     except Exception as e:
-        print(f"Failed to sync commands: {e}")
+        log.error("Failed to sync commands: %s", e)
 
-    print(f"Logged in as {bot.user} (ID: {bot.user.id})")
+    log.info("Logged in as %s (ID: %s)", bot.user, bot.user.id)
     await bot.change_presence(activity=discord.Game(name="Let's chat!"))
 
 
 # Load cogs
 async def load_cogs():
     if not os.path.exists(COGS_DIR):
-        print(f"Cogs directory not found: {COGS_DIR}")
+        log.error("Cogs directory not found: %s", COGS_DIR)
         sys.exit(1)  # exit if cogs can't be loaded
 
     for filename in os.listdir(COGS_DIR):
@@ -67,19 +90,23 @@ async def load_cogs():
             extension = f"cogs.{filename[:-3]}"
             try:
                 await bot.load_extension(extension)
-                print(f"Loaded {extension}")
+                log.info("Loaded %s", extension)
             except Exception as e:
                 FAILED_COGS[extension] = str(e)
-                print(f"Failed to load {extension}: {e}")
+                log.error("Failed to load %s: %s", extension, e)
 
 
 # ─── Global Error Handlers ───
 
-# print errors to terminal
+# log errors
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
-    print(f"[App Command Error] in /{interaction.command.name if interaction.command else 'unknown'}:")
-    traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+    command = interaction.command.name if interaction.command else "unknown"
+    log.error(
+        "App command error in /%s", command,
+        exc_info=error,
+        extra={"command": command, "guild": interaction.guild_id}
+    )
 
     # Notify user
     try:
@@ -88,6 +115,9 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
                 "An error occurred while running this command.",
                 ephemeral=True
             )
+        else:
+            # e.g. the command was auto-deferred before it failed
+            await interaction.followup.send("An error occurred while running this command.", ephemeral=True)
     except Exception:
         # Interaction may already be acknowledged or otherwise problematic; swallow to avoid crashing
         pass
@@ -96,15 +126,13 @@ async def on_app_command_error(interaction: discord.Interaction, error: app_comm
 # handle errors w/ prefix (somewhat redundant due to lack of prefixed commands)
 @bot.event
 async def on_command_error(ctx: commands.Context, error: commands.CommandError):
-    print(f"[Command Error] in command {ctx.command}:")
-    traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
+    log.error("Command error in %s", ctx.command, exc_info=error, extra={"command": str(ctx.command)})
 
 
 # Unhandled errors in listeners
 @bot.event
 async def on_error(event_method: str, *args, **kwargs):
-    print(f"[Unhandled Error] in event {event_method}:")
-    traceback.print_exc()
+    log.exception("Unhandled error in event %s", event_method, extra={"event": event_method})
 
 
 # Cog management, limited to Sadie
@@ -242,6 +270,58 @@ async def reload_all_cogs(interaction: discord.Interaction):
     await interaction.response.send_message(msg, ephemeral=True)
 
 
+# profile the live process for a number of seconds
+@bot.tree.command(name="profile", description="Profile the bot for a number of seconds.")
+@app_commands.describe(seconds=f"How long to profile for (1-{PROFILE_MAX_SECONDS}).")
+async def profile(interaction: discord.Interaction, seconds: int = 30):
+    if not await bot.is_owner(interaction.user):
+        await interaction.response.send_message("You don't look like Sadie...", ephemeral=True)
+        return
+
+    if PROFILE_LOCK.locked():
+        await interaction.response.send_message("A profiling session is already running.", ephemeral=True)
+        return
+
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    await interaction.response.defer(ephemeral=True, thinking=True)
+
+    async with PROFILE_LOCK:
+        # cProfile hooks the current thread, which is the event loop thread running every cog
+        profiler = cProfile.Profile()
+        started_tracemalloc = not tracemalloc.is_tracing()
+        if started_tracemalloc:
+            tracemalloc.start()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+    report = io.StringIO()
+    report.write(f"Rainfall profile ({seconds}s)\n\n")
+    report.write(f"=== Top {PROFILE_TOP_N} functions by cumulative time ===\n")
+    stats = pstats.Stats(profiler, stream=report)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
+
+    report.write(f"\n=== Top {PROFILE_TOP_N} allocation sites ===\n")
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    for stat in snapshot.statistics("lineno")[:PROFILE_TOP_N]:
+        report.write(f"{stat}\n")
+
+    data = io.BytesIO(report.getvalue().encode())
+    await interaction.followup.send(
+        f"Profiled for {seconds}s.",
+        file=discord.File(data, filename="rainfall_profile.txt"),
+        ephemeral=True
+    )
+
+
 # run bot with loaded cogs
 async def main():
     async with bot:
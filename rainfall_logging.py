@@ -0,0 +1,134 @@
+# rainfall_logging.py
+# non-blocking structured logging for rainfall
+# records are queued on the event loop and formatted/written on a background thread
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+# extra fields that get lifted into the JSON output when passed via `extra=`
+CONTEXT_FIELDS = ("ticket", "guild", "direction", "event", "command")
+
+# bounded so a stalled writer can never grow memory without limit
+QUEUE_SIZE = 10000
+
+# repeated warnings/errors: let SAMPLE_BURST through per SAMPLE_WINDOW seconds, drop the rest
+SAMPLE_WINDOW = 60.0
+SAMPLE_BURST = 5
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats a record as a single JSON line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        dropped = getattr(record, "dropped", 0)
+        if dropped:
+            entry["dropped"] = dropped
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops repeats of the same warning/error past a small burst per window.
+    The next record let through carries how many were dropped in `suppressed`."""
+
+    def __init__(self, window: float = SAMPLE_WINDOW, burst: int = SAMPLE_BURST):
+        super().__init__()
+        self.window = window
+        self.burst = burst
+        # key -> [window_start, seen, dropped]
+        self.seen: dict[tuple, list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.msg, exc_type)
+        now = time.monotonic()
+        state = self.seen.get(key)
+        if state is None or now - state[0] >= self.window:
+            dropped = state[2] if state else 0
+            self.seen[key] = [now, 1, 0]
+            if dropped:
+                record.suppressed = dropped
+            return True
+        state[1] += 1
+        if state[1] <= self.burst:
+            return True
+        state[2] += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks the caller and leaves formatting to the listener thread."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # only resolve the message now (args may be mutated later); tracebacks and JSON happen off-loop
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        # the next record that makes it onto the queue reports how many were lost before it
+        with self._lock_dropped:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            record.dropped = dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += dropped + 1
+
+
+_listener = None
+
+
+def setup_logging(level: str = "INFO", stream=None) -> logging.handlers.QueueListener:
+    """Route all logging through a bounded queue to a JSON writer on a background thread."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(q)
+    handler.addFilter(SamplingFilter())
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JSONFormatter())
+
+    root = logging.getLogger()
+    root.handlers.clear()
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(q, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
@@ -0,0 +1,213 @@
+# relay_log.py
+# durable, append-only log of relayed messages for at-least-once delivery
+# every relay is recorded before it's sent and acknowledged after, anything unacknowledged is retried
+import asyncio
+import collections
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+log = logging.getLogger("rainfall.relay_log")
+
+# retry backoff: RETRY_BASE * 2^attempts seconds, capped at RETRY_MAX
+RETRY_BASE = 2.0
+RETRY_MAX = 300.0
+# entries older than this are dropped instead of retried
+MAX_AGE = 24 * 3600
+# how many delivered keys are remembered for deduplication
+DELIVERED_WINDOW = 10000
+# how long close() waits for relays that are still being sent
+DRAIN_TIMEOUT = 10.0
+# rewrite the log once it has grown past twice its size after the last rewrite, and by at least this many lines
+COMPACT_MIN_LINES = 1000
+
+
+class RelayLog:
+    """Append-only JSON-lines log of relay entries.
+
+    Lines are `{"op": "record", "key": ..., ...}` when a relay starts, and
+    `{"op": "ack", "key": ...}` once it was delivered (or dropped). Keys are the
+    source message ids, so a message seen twice is only ever relayed once."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # key -> entry, for records without an ack
+        self.pending: dict[str, dict] = {}
+        self.delivered: collections.OrderedDict[str, None] = collections.OrderedDict()
+        # lines appended since the last rewrite, and how many lines that rewrite left
+        self.appended = 0
+        self.compacted_lines = 0
+        # lines appended while a background compaction is writing the new file, None when none is running
+        self.compaction_tail: Optional[list[str]] = None
+        # keys between record() and ack()/retry(), set while there are none
+        self.in_flight: set[str] = set()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.wakeup = asyncio.Event()
+        self.load()
+        self.file = open(self.path, "a")
+
+    # ----- persistence -----
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash mid-write
+                if entry.get("op") == "record":
+                    self.pending[entry["key"]] = entry
+                elif entry.get("op") == "ack":
+                    self.pending.pop(entry["key"], None)
+                    self.remember_delivered(entry["key"])
+        # everything left over from the last run is due now
+        for entry in self.pending.values():
+            entry["next_try"] = 0.0
+        if self.pending:
+            log.info("Replaying %d unacknowledged relays", len(self.pending))
+        self.compact()
+
+    def append(self, line: dict):
+        # flushed to the OS right away; no fsync so the event loop never waits on the disk
+        text = json.dumps(line) + "\n"
+        self.file.write(text)
+        self.file.flush()
+        self.appended += 1
+        if self.compaction_tail is not None:
+            self.compaction_tail.append(text)
+        if self.compaction_due():
+            self.wakeup.set()  # the retry worker compacts, off the relay path
+
+    def compaction_due(self) -> bool:
+        return self.compaction_tail is None and self.appended >= max(COMPACT_MIN_LINES, self.compacted_lines)
+
+    def snapshot(self) -> tuple[list[str], list[dict]]:
+        """What the log has to keep: delivered keys and pending records. Cheap copies, formatting happens in write_log."""
+        return list(self.delivered), [{k: v for k, v in entry.items() if k != "next_try"} for entry in self.pending.values()]
+
+    def replace_file(self, tmp_path: str, line_count: int):
+        os.replace(tmp_path, self.path)
+        if getattr(self, "file", None):
+            self.file.close()
+            self.file = open(self.path, "a")
+        self.appended = 0
+        self.compacted_lines = line_count
+
+    def compact(self):
+        """Rewrite the log with only pending records and the delivered keys, dropping delivered content.
+        Blocks while writing, only used at startup and on close; the retry worker uses compact_in_background."""
+        tmp_path = f"{self.path}.tmp"
+        self.replace_file(tmp_path, write_log(tmp_path, *self.snapshot()))
+
+    async def compact_in_background(self):
+        """Like compact(), but the file is written in a thread. Lines appended meanwhile still go to
+        the old file (so a crash loses nothing) and are copied into the new one before it replaces it."""
+        self.compaction_tail = []
+        tmp_path = f"{self.path}.compact"
+        try:
+            line_count = await asyncio.to_thread(write_log, tmp_path, *self.snapshot())
+            with open(tmp_path, "a") as f:
+                f.writelines(self.compaction_tail)
+            self.replace_file(tmp_path, line_count + len(self.compaction_tail))
+        finally:
+            self.compaction_tail = None
+
+    async def close(self):
+        """Wait for relays in flight to be acked (or handed to retry()), then compact and close the file.
+        Closing under them would fail their ack, and whoever loads the log next would send them again."""
+        try:
+            await asyncio.wait_for(self.idle.wait(), DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            log.warning("Closing the relay log with %d relays still in flight", len(self.in_flight))
+        self.compact()
+        self.file.close()
+
+    def remember_delivered(self, key: str):
+        self.delivered[key] = None
+        while len(self.delivered) > DELIVERED_WINDOW:
+            self.delivered.popitem(last=False)
+
+    # ----- relay lifecycle -----
+    def record(self, key: str, **fields) -> Optional[dict]:
+        """Log a relay before it's attempted. Returns None if this key was already relayed or is in flight."""
+        if key in self.delivered or key in self.pending:
+            return None
+        entry = {"op": "record", "key": key, "ts": time.time(), "attempts": 0, **fields}
+        self.append(entry)
+        # in flight on the hot path, the retry worker leaves it alone until retry() is called
+        entry["next_try"] = None
+        self.pending[key] = entry
+        self.in_flight.add(key)
+        self.idle.clear()
+        return entry
+
+    def settled(self, key: str):
+        self.in_flight.discard(key)
+        if not self.in_flight:
+            self.idle.set()
+
+    def ack(self, entry: dict):
+        self.append({"op": "ack", "key": entry["key"]})
+        self.pending.pop(entry["key"], None)
+        self.remember_delivered(entry["key"])
+        self.settled(entry["key"])
+
+    def retry(self, entry: dict):
+        """Hand a failed relay to the retry worker with exponential backoff."""
+        entry["next_try"] = time.time() + min(RETRY_MAX, RETRY_BASE * 2 ** entry["attempts"])
+        entry["attempts"] += 1
+        self.settled(entry["key"])
+        self.wakeup.set()
+
+    async def retry_worker(self, deliver: Callable[[dict], Awaitable[bool]]):
+        """Background task: redeliver pending entries as they come due.
+        `deliver` returns True when sent, False when the relay can never succeed (e.g. ticket closed),
+        and raises to have the entry retried later."""
+        while True:
+            self.wakeup.clear()
+            if self.compaction_due():
+                try:
+                    await self.compact_in_background()
+                except OSError:
+                    log.exception("Failed to compact the relay log")
+            now = time.time()
+            due = [e for e in self.pending.values() if e["next_try"] is not None and e["next_try"] <= now]
+            for entry in due:
+                if now - entry["ts"] > MAX_AGE:
+                    log.warning("Dropping relay after %d attempts", entry["attempts"],
+                                extra={"ticket": entry.get("ticket"), "guild": entry.get("guild"), "direction": entry.get("direction")})
+                    self.ack(entry)
+                    continue
+                entry["next_try"] = None
+                try:
+                    delivered = await deliver(entry)
+                except Exception:
+                    log.warning("Relay retry failed", exc_info=True,
+                                extra={"ticket": entry.get("ticket"), "guild": entry.get("guild"), "direction": entry.get("direction")})
+                    self.retry(entry)
+                    continue
+                if not delivered:
+                    log.info("Dropping relay for a closed ticket",
+                             extra={"ticket": entry.get("ticket"), "guild": entry.get("guild"), "direction": entry.get("direction")})
+                self.ack(entry)
+
+            waiting = [e["next_try"] for e in self.pending.values() if e["next_try"] is not None]
+            timeout = max(0.0, min(waiting) - time.time()) if waiting else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+
+def write_log(path: str, delivered: list[str], pending: list[dict]) -> int:
+    """Write a compacted log to `path`, returning its line count."""
+    with open(path, "w") as f:
+        for key in delivered:
+            f.write(json.dumps({"op": "ack", "key": key}) + "\n")
+        for entry in pending:
+            f.write(json.dumps(entry) + "\n")
+    return len(delivered) + len(pending)
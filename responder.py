@@ -0,0 +1,138 @@
+# responder.py
+# slash command responses that stay within Discord's limits under load
+# defers automatically when a handler is slow and pages output that doesn't fit in one message
+import asyncio
+from typing import Awaitable, Callable, Optional
+
+import discord
+
+# defer once an interaction is this old without an answer (Discord allows 3 seconds from its creation)
+DEFER_AFTER = 1.5
+# Discord's message content limit
+MESSAGE_LIMIT = 2000
+# room for a page's body, leaving space for wrapping (e.g. code fences) and the page footer
+PAGE_BODY_LIMIT = MESSAGE_LIMIT - 100
+# how long page buttons keep working
+PAGINATOR_TIMEOUT = 300
+
+
+class Responder:
+    """Answers an interaction with send_message if the handler is fast, or defers once the
+    interaction is DEFER_AFTER seconds old and answers through the followup webhook instead.
+    Handlers that are always slow pass defer_after=0 to defer right away.
+
+        async with Responder(interaction) as respond:
+            await respond.send("Done!")
+    """
+
+    def __init__(self, interaction: discord.Interaction, ephemeral: bool = True, defer_after: float = DEFER_AFTER):
+        self.interaction = interaction
+        self.ephemeral = ephemeral
+        self.defer_after = defer_after
+        # held while responding so the deferral and the real answer never race
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "Responder":
+        if self.defer_after <= 0:
+            await self.defer()
+        self.timer = asyncio.create_task(self.defer_later())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.timer.cancel()
+
+    def defer_delay(self) -> float:
+        # counted from the interaction's creation, so gateway lag and time before the handler ran count too
+        age = (discord.utils.utcnow() - self.interaction.created_at).total_seconds()
+        return max(0.0, self.defer_after - age)
+
+    async def defer_later(self):
+        await asyncio.sleep(self.defer_delay())
+        await self.defer()
+
+    async def defer(self):
+        async with self.lock:
+            if not self.interaction.response.is_done():
+                await self.interaction.response.defer(ephemeral=self.ephemeral, thinking=True)
+
+    async def send(self, content: Optional[str] = None, **kwargs):
+        async with self.lock:
+            # safe to cancel here, the timer is either still sleeping or waiting on the lock
+            self.timer.cancel()
+            if self.interaction.response.is_done():
+                await self.interaction.followup.send(content, ephemeral=self.ephemeral, **kwargs)
+            else:
+                await self.interaction.response.send_message(content, ephemeral=self.ephemeral, **kwargs)
+
+    async def send_pages(self, render: Callable[[int], Awaitable[str]], page_count: int):
+        """Send output that may not fit in one message. Pages are only rendered when shown."""
+        if page_count <= 1:
+            await self.send(await render(0))
+            return
+        paginator = Paginator(self.interaction, render, page_count)
+        await self.send(await paginator.render_page(), view=paginator)
+
+
+class Paginator(discord.ui.View):
+    """Previous/next buttons over lazily rendered pages, on the response to `interaction`."""
+
+    def __init__(self, interaction: discord.Interaction, render: Callable[[int], Awaitable[str]], page_count: int):
+        super().__init__(timeout=PAGINATOR_TIMEOUT)
+        # the command's interaction, its token can still edit the message once the buttons time out
+        self.interaction = interaction
+        self.owner = interaction.user
+        self.render = render
+        self.page_count = page_count
+        self.page = 0
+        self.update_buttons()
+
+    def update_buttons(self):
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.page_count - 1
+
+    async def render_page(self) -> str:
+        footer = f"\n\n-# Page {self.page + 1}/{self.page_count}"
+        return (await self.render(self.page))[:MESSAGE_LIMIT - len(footer)] + footer
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return interaction.user.id == self.owner.id
+
+    async def turn(self, interaction: discord.Interaction, step: int):
+        # rendering can be slow (e.g. member lookups), so acknowledge the click first
+        await interaction.response.defer()
+        self.page = max(0, min(self.page_count - 1, self.page + step))
+        self.update_buttons()
+        await interaction.edit_original_response(content=await self.render_page(), view=self)
+
+    async def on_timeout(self):
+        # expired buttons would still look clickable and fail with "This interaction failed"
+        for item in self.children:
+            item.disabled = True
+        try:
+            await self.interaction.edit_original_response(view=self)
+        except discord.HTTPException:
+            pass  # e.g. the message was dismissed
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, -1)
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.turn(interaction, 1)
+
+
+def split_pages(text: str, limit: int) -> list[tuple[int, int]]:
+    """Split text into (start, end) ranges of at most `limit` characters, breaking on newlines where possible."""
+    ranges = []
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + limit)
+        if end < len(text):
+            newline = text.rfind("\n", start, end)
+            if newline > start:
+                end = newline + 1
+        ranges.append((start, end))
+        start = end
+    return ranges
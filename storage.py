@@ -0,0 +1,45 @@
+# storage.py
+# shared JSON storage helpers for guild and ticket configs
+# writes are version-checked so a stale read-modify-write can't silently overwrite a newer one
+import json
+import os
+
+# every stored dict carries a counter that increases by one on each write
+VERSION_KEY = "_version"
+
+
+class VersionConflict(Exception):
+    """Raised when the file on disk changed (or vanished) since the data being saved was read."""
+
+
+def read_json(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_json_versioned(path: str, data: dict, must_exist: bool = False):
+    """Write `data` to `path` if the stored version still matches the one `data` was read at.
+    Pass must_exist=True when `data` was loaded from `path`, so a file deleted in the meantime
+    (even one from before versioning, with no version) is a conflict rather than recreated.
+    Bumps data[VERSION_KEY] on success. The write goes through a temp file so readers never see a partial file."""
+    expected = data.get(VERSION_KEY, 0)
+    if os.path.exists(path):
+        try:
+            current = read_json(path).get(VERSION_KEY, 0)
+        except ValueError:
+            current = 0  # unreadable files get overwritten, same as before versioning
+    else:
+        current = None
+    # a missing file only matches data that has never been saved
+    if current is None and must_exist:
+        raise VersionConflict(f"{path}: deleted since it was loaded")
+    if current != expected and not (current is None and expected == 0):
+        raise VersionConflict(f"{path}: expected version {expected}, found {current}")
+
+    data[VERSION_KEY] = expected + 1
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
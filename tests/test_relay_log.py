@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import relay_log
+from relay_log import RelayLog
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_replays_unacknowledged_relays(tmp_path):
+    path = tmp_path / "relay.log"
+    log = RelayLog(str(path))
+    delivered = log.record("1", content="a")
+    log.ack(delivered)
+    log.record("2", content="b")
+    log.file.close()  # a crash, no compaction
+
+    reloaded = RelayLog(str(path))
+    assert list(reloaded.pending) == ["2"]
+    assert reloaded.pending["2"]["content"] == "b"
+    assert reloaded.pending["2"]["next_try"] == 0.0
+    assert "1" in reloaded.delivered
+
+
+def test_ignores_a_torn_final_line(tmp_path):
+    path = tmp_path / "relay.log"
+    path.write_text('{"op": "record", "key": "1", "ts": 0, "attempts": 0}\n{"op": "ack", "ke')
+    assert list(RelayLog(str(path)).pending) == ["1"]
+
+
+def test_record_dedupes_delivered_and_in_flight_keys(tmp_path):
+    log = RelayLog(str(tmp_path / "relay.log"))
+    entry = log.record("1")
+    assert log.record("1") is None
+    log.ack(entry)
+    assert log.record("1") is None
+
+    log.file.close()
+    assert RelayLog(str(tmp_path / "relay.log")).record("1") is None
+
+
+def test_compaction_keeps_pending_and_delivered_keys(tmp_path, monkeypatch):
+    monkeypatch.setattr(relay_log, "COMPACT_MIN_LINES", 10)
+    path = tmp_path / "relay.log"
+    log = RelayLog(str(path))
+
+    async def run():
+        stuck = log.record("stuck", content="keep me")
+        log.retry(stuck)
+        stuck["next_try"] = float("inf")
+        for i in range(20):
+            log.ack(log.record(str(i), content="x" * 100))
+        assert log.compaction_due()
+        await log.compact_in_background()
+
+    asyncio.run(run())
+    lines = read_lines(path)
+    assert len(lines) == 21
+    assert all("content" not in line for line in lines if line["key"] != "stuck")
+    assert not log.compaction_due()
+
+    log.file.close()
+    reloaded = RelayLog(str(path))
+    assert list(reloaded.pending) == ["stuck"]
+    assert reloaded.pending["stuck"]["content"] == "keep me"
+    assert reloaded.record("7") is None
+
+
+def test_lines_appended_during_compaction_survive(tmp_path, monkeypatch):
+    path = tmp_path / "relay.log"
+    log = RelayLog(str(path))
+    first = log.record("1")
+    write_log = relay_log.write_log
+
+    def slow_write(*args):
+        # the relay path keeps running while the compacted file is written
+        log.ack(first)
+        log.record("2")
+        return write_log(*args)
+
+    monkeypatch.setattr(relay_log, "write_log", slow_write)
+    asyncio.run(log.compact_in_background())
+    monkeypatch.undo()
+
+    log.file.close()
+    reloaded = RelayLog(str(path))
+    assert list(reloaded.pending) == ["2"]
+    assert "1" in reloaded.delivered
+
+
+def test_close_waits_for_relays_in_flight(tmp_path):
+    path = tmp_path / "relay.log"
+    log = RelayLog(str(path))
+
+    async def run():
+        entry = log.record("1")
+
+        async def send():
+            await asyncio.sleep(0.05)
+            log.ack(entry)
+
+        sending = asyncio.create_task(send())
+        await log.close()
+        await sending
+
+    asyncio.run(run())
+    reloaded = RelayLog(str(path))
+    assert not reloaded.pending
+    assert "1" in reloaded.delivered
+
+
+def test_retry_worker_redelivers_and_drops(tmp_path):
+    log = RelayLog(str(tmp_path / "relay.log"))
+    sent = []
+
+    async def deliver(entry):
+        sent.append(entry["key"])
+        return entry["key"] != "closed"
+
+    async def run():
+        for key in ("1", "closed"):
+            entry = log.record(key)
+            log.retry(entry)
+            entry["next_try"] = 0.0
+        worker = asyncio.create_task(log.retry_worker(deliver))
+        await asyncio.sleep(0.05)
+        worker.cancel()
+
+    asyncio.run(run())
+    assert sorted(sent) == ["1", "closed"]
+    assert not log.pending
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from storage import VERSION_KEY, VersionConflict, read_json, write_json_versioned
+
+
+def test_read_missing_file_is_empty(tmp_path):
+    assert read_json(str(tmp_path / "missing.json")) == {}
+
+
+def test_versions_increase_on_each_write(tmp_path):
+    path = str(tmp_path / "config.json")
+    data = {"a": 1}
+    write_json_versioned(path, data)
+    write_json_versioned(path, data)
+    assert data[VERSION_KEY] == 2
+    assert read_json(path) == {"a": 1, VERSION_KEY: 2}
+
+
+def test_stale_write_conflicts(tmp_path):
+    path = str(tmp_path / "config.json")
+    write_json_versioned(path, {"a": 1})
+    first, second = read_json(path), read_json(path)
+    write_json_versioned(path, first)
+    with pytest.raises(VersionConflict):
+        write_json_versioned(path, second)
+    assert read_json(path)[VERSION_KEY] == 2
+
+
+def test_unversioned_file_counts_as_version_zero(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"a": 1}))
+    write_json_versioned(str(path), read_json(str(path)))
+    assert read_json(str(path))[VERSION_KEY] == 1
+
+
+def test_deleted_file_conflicts_only_when_it_must_exist(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"a": 1}))
+    data = read_json(str(path))
+    path.unlink()
+    with pytest.raises(VersionConflict):
+        write_json_versioned(str(path), data, must_exist=True)
+    assert not path.exists()
+    write_json_versioned(str(path), {"b": 2})
+    assert read_json(str(path)) == {"b": 2, VERSION_KEY: 1}
@@ -0,0 +1,476 @@
+# tools/loadsim.py
+# end-to-end load simulator for rainfall
+# drives the real cogs against a local stand-in for the discord gateway and REST API
+#
+# usage:
+#   python tools/loadsim.py --tickets 500 --duration 60 --rate 200
+#   python tools/loadsim.py --script traffic.jsonl
+#
+# a script is one JSON event per line: {"at": 1.5, "kind": "user_dm", "ticket": 3}
+# kinds: user_dm, user_edit, user_attachment, staff_reply, staff_attachment
+import argparse
+import asyncio
+import datetime
+import io
+import itertools
+import json
+import os
+import random
+import re
+import resource
+import sys
+import tempfile
+import time
+from typing import Optional
+
+# the cogs use relative storage dirs, so run everything out of a scratch directory
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import discord
+
+KINDS = ["user_dm", "user_edit", "user_attachment", "staff_reply", "staff_attachment"]
+DEFAULT_MIX = {"user_dm": 45, "user_edit": 5, "user_attachment": 5, "staff_reply": 40, "staff_attachment": 5}
+
+# every relayed message carries a marker so delivery can be matched to injection
+MARKER_RE = re.compile(r"#sim(\d+)")
+_ids = itertools.count(10**17)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+# ─── Fake REST layer ───
+class Bucket:
+    """Fixed-window rate-limit bucket, like the ones Discord hands out per route."""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def try_acquire(self, now: float) -> Optional[float]:
+        """Take a slot, or return how long to wait before retrying (a 429)."""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window
+        if self.remaining > 0:
+            self.remaining -= 1
+            return None
+        return self.reset_at - now
+
+
+class FakeHTTP:
+    """Enforces per-route and global buckets and adds simulated request latency.
+    On a 429 it sleeps for retry_after and tries again, the same as discord.py does."""
+
+    def __init__(self, latency: float, jitter: float, route_limit: int, route_window: float, global_limit: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.route_limit = route_limit
+        self.route_window = route_window
+        self.global_bucket = Bucket(global_limit, 1.0)
+        self.buckets: dict[str, Bucket] = {}
+        self.requests = 0
+        self.rate_limited = 0
+        self.by_route: dict[str, int] = {}
+
+    async def request(self, route: str, major: int):
+        key = f"{route}:{major}"
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = Bucket(self.route_limit, self.route_window)
+        while True:
+            now = time.monotonic()
+            retry_after = self.global_bucket.try_acquire(now)
+            if retry_after is None:
+                retry_after = bucket.try_acquire(now)
+            if retry_after is None:
+                break
+            self.rate_limited += 1
+            await asyncio.sleep(retry_after)
+        self.requests += 1
+        self.by_route[route] = self.by_route.get(route, 0) + 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+
+# ─── Fake discord objects ───
+class FakeAttachment:
+    def __init__(self, http: FakeHTTP, size: int):
+        self.http = http
+        self.size = size
+        self.filename = "sim.bin"
+        self.url = f"https://cdn.invalid/attachments/{next_id()}/{self.filename}"
+
+    async def to_file(self):
+        # CDN downloads are not rate limited, only slow
+        await asyncio.sleep(max(0.0, random.gauss(self.http.latency * 2, self.http.jitter)))
+        return discord.File(fp=io.BytesIO(b"\0" * self.size), filename=self.filename)
+
+
+class FakeDMChannel:
+    def __init__(self, sim: "Simulator", channel_id: int):
+        self.sim = sim
+        self.id = channel_id
+        self.type = discord.ChannelType.private
+
+    async def send(self, content=None, files=None, embeds=None, view=None):
+        await self.sim.http.request("POST /channels/{id}/messages", self.id)
+        self.sim.delivered(content, "staff_to_user")
+
+
+class FakeUser:
+    def __init__(self, sim: "Simulator", name: str):
+        self.sim = sim
+        self.id = next_id()
+        self.name = name
+        self.display_name = name
+        self.bot = False
+        self.dm_channel_id = next_id()
+        # like after a restart: the DM channel isn't cached until the user talks to us or we create it
+        self.dm_channel: Optional[FakeDMChannel] = None
+        self.mutual_guilds = []
+
+    async def create_dm(self) -> FakeDMChannel:
+        if self.dm_channel is None:
+            await self.sim.http.request("POST /users/@me/channels", 0)
+            self.dm_channel = FakeDMChannel(self.sim, self.dm_channel_id)
+        return self.dm_channel
+
+    async def send(self, content=None, files=None, embeds=None, view=None):
+        channel = await self.create_dm()
+        await channel.send(content=content, files=files, embeds=embeds, view=view)
+
+    def __str__(self):
+        return self.name
+
+
+class FakeThread:
+    def __init__(self, sim: "Simulator", guild: "FakeGuild"):
+        self.sim = sim
+        self.id = next_id()
+        self.guild = guild
+        self.type = discord.ChannelType.public_thread
+
+    async def send(self, content=None, files=None, embeds=None):
+        await self.sim.http.request("POST /channels/{id}/messages", self.id)
+        self.sim.delivered(content, "user_to_staff")
+
+    async def edit(self, **kwargs):
+        await self.sim.http.request("PATCH /channels/{id}", self.id)
+
+
+class FakeGuild:
+    def __init__(self, name: str):
+        self.id = next_id()
+        self.name = name
+        self.owner_id = 0
+        self.threads: dict[int, FakeThread] = {}
+        self.members: dict[int, FakeUser] = {}
+
+    def get_thread(self, thread_id):
+        return self.threads.get(thread_id)
+
+    def get_channel(self, channel_id):
+        return self.threads.get(channel_id)
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+
+class FakeMessage:
+    def __init__(self, sim: "Simulator", author: FakeUser, content: str, guild=None, channel=None, attachments=()):
+        self.sim = sim
+        self.id = next_id()
+        self.author = author
+        self.content = content
+        self.guild = guild
+        self.channel = channel
+        self.attachments = list(attachments)
+        self.embeds = []
+        self.stickers = []
+        self.edited_at = None
+
+    async def add_reaction(self, emoji):
+        await self.sim.http.request("PUT /channels/{id}/messages/{id}/reactions", self.channel.id)
+
+
+class FakeBot:
+    """Just enough of commands.Bot for the cogs to run."""
+
+    def __init__(self, sim: "Simulator"):
+        self.sim = sim
+        self.guilds: list[FakeGuild] = []
+        self.users: dict[int, FakeUser] = {}
+        self.cogs: dict[str, object] = {}
+        self.user = None
+
+    def get_guild(self, guild_id):
+        return next((g for g in self.guilds if g.id == guild_id), None)
+
+    def get_user(self, user_id):
+        return self.users.get(user_id)
+
+    async def fetch_user(self, user_id):
+        return self.users.get(user_id)
+
+    def get_partial_messageable(self, channel_id, type=None):
+        return FakeDMChannel(self.sim, channel_id)
+
+    def is_ready(self):
+        return True
+
+    def get_cog(self, name):
+        return self.cogs.get(name)
+
+    async def is_owner(self, user):
+        return False
+
+
+class FakeGateway:
+    """Dispatches events to cog listeners as independent tasks, like the real gateway."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.listeners: dict[str, list] = {}
+        self.tasks: set[asyncio.Task] = set()
+
+    def add_listener(self, event: str, func):
+        self.listeners.setdefault(event, []).append(func)
+
+    def dispatch(self, event: str, *args):
+        for func in self.listeners.get(event, []):
+            task = asyncio.create_task(self._run(func, *args))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, func, *args):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        await func(*args)
+
+
+# ─── Simulation ───
+class Ticket:
+    def __init__(self, user: FakeUser, guild: FakeGuild, thread: FakeThread, anonymous: bool):
+        self.user = user
+        self.guild = guild
+        self.thread = thread
+        self.anonymous = anonymous
+        self.last_dm: Optional[FakeMessage] = None
+
+
+class Simulator:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.http = FakeHTTP(args.latency, args.jitter, args.route_limit, args.route_window, args.global_limit)
+        self.gateway = FakeGateway(args.gateway_delay)
+        self.bot = FakeBot(self)
+        self.tickets: list[Ticket] = []
+        self.staff: list[FakeUser] = []
+        self.seq = itertools.count()
+        self.injected: dict[int, float] = {}
+        self.latencies: dict[str, list[float]] = {"user_to_staff": [], "staff_to_user": []}
+        self.memory: list[tuple[float, int]] = []
+        self.started = 0.0
+
+    def delivered(self, content: Optional[str], direction: str):
+        # edits carry the previous message's marker too, which has already been counted
+        for match in MARKER_RE.finditer(content or ""):
+            sent_at = self.injected.pop(int(match.group(1)), None)
+            if sent_at is not None:
+                self.latencies[direction].append(time.monotonic() - sent_at)
+
+    def setup(self):
+        from cogs.config_manager import ConfigManager
+        from cogs.dm_handler import DMHandler
+
+        for g in range(self.args.guilds):
+            self.bot.guilds.append(FakeGuild(f"Guild {g}"))
+        for i in range(self.args.staff):
+            self.staff.append(FakeUser(self, f"staff{i}"))
+
+        self.bot.cogs["ConfigManager"] = ConfigManager(self.bot)
+        handler = DMHandler(self.bot)
+        self.bot.cogs["DMHandler"] = handler
+        self.gateway.add_listener("message", handler.on_message)
+        self.gateway.add_listener("message_edit", handler.on_message_edit)
+        self.handler = handler
+
+        # open tickets are seeded straight into storage so the run measures relaying only
+        for i in range(self.args.tickets):
+            guild = self.bot.guilds[i % len(self.bot.guilds)]
+            user = FakeUser(self, f"user{i}")
+            user.mutual_guilds = [guild]
+            guild.members[user.id] = user
+            self.bot.users[user.id] = user
+            thread = FakeThread(self, guild)
+            guild.threads[thread.id] = thread
+            anonymous = random.random() < self.args.anon_ratio
+            handler.save_user_config(guild.id, user, {
+                "ticket_open": True,
+                "identity_mode": "anonymous" if anonymous else "identified",
+                "thread_id": thread.id,
+                "guild_id": guild.id,
+            })
+            self.tickets.append(Ticket(user, guild, thread, anonymous))
+
+    def inject(self, kind: str, ticket: Ticket):
+        seq = next(self.seq)
+        content = f"load test message #sim{seq}"
+        attachments = [FakeAttachment(self.http, self.args.attachment_size)] if kind.endswith("attachment") else ()
+        self.injected[seq] = time.monotonic()
+
+        if kind.startswith("user"):
+            # receiving a DM caches its channel, the same as the real client
+            ticket.user.dm_channel = FakeDMChannel(self, ticket.user.dm_channel_id)
+            msg = FakeMessage(self, ticket.user, content, channel=ticket.user.dm_channel, attachments=attachments)
+            if kind == "user_edit" and ticket.last_dm:
+                msg.id = ticket.last_dm.id
+                msg.edited_at = datetime.datetime.now(datetime.timezone.utc)
+                self.gateway.dispatch("message_edit", ticket.last_dm, msg)
+            else:
+                self.gateway.dispatch("message", msg)
+            ticket.last_dm = msg
+        else:
+            author = random.choice(self.staff)
+            msg = FakeMessage(self, author, content, guild=ticket.guild, channel=ticket.thread, attachments=attachments)
+            self.gateway.dispatch("message", msg)
+
+    async def random_traffic(self):
+        kinds = list(self.args.mix)
+        weights = [self.args.mix[k] for k in kinds]
+        end = self.started + self.args.duration
+        while time.monotonic() < end:
+            self.inject(random.choices(kinds, weights)[0], random.choice(self.tickets))
+            await asyncio.sleep(random.expovariate(self.args.rate))
+
+    async def scripted_traffic(self, path: str):
+        with open(path, "r") as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        for event in sorted(events, key=lambda e: e.get("at", 0)):
+            delay = self.started + event.get("at", 0) - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            ticket = self.tickets[event.get("ticket", 0) % len(self.tickets)]
+            self.inject(event["kind"], ticket)
+
+    async def sample_memory(self):
+        page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        while True:
+            try:
+                with open("/proc/self/statm", "r") as f:
+                    rss = int(f.read().split()[1]) * page_size
+            except OSError:
+                rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+            self.memory.append((time.monotonic() - self.started, rss))
+            await asyncio.sleep(self.args.memory_interval)
+
+    async def run(self) -> dict:
+        self.setup()
+        await self.handler.cog_load()
+        self.started = time.monotonic()
+        sampler = asyncio.create_task(self.sample_memory())
+        if self.args.script:
+            await self.scripted_traffic(self.args.script)
+        else:
+            await self.random_traffic()
+        # let in-flight relays drain before reporting
+        while self.gateway.tasks:
+            await asyncio.gather(*list(self.gateway.tasks), return_exceptions=True)
+        elapsed = time.monotonic() - self.started
+        sampler.cancel()
+        await self.handler.cog_unload()
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        relayed = sum(len(v) for v in self.latencies.values())
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "tickets": len(self.tickets),
+            "relayed": relayed,
+            "lost": len(self.injected),
+            "throughput_per_s": round(relayed / elapsed, 2) if elapsed else 0.0,
+            "requests": self.http.requests,
+            "rate_limited_429": self.http.rate_limited,
+            "requests_by_route": self.http.by_route,
+            "latency_ms": {d: percentiles(v) for d, v in self.latencies.items()},
+            "memory_rss_bytes": [(round(t, 1), rss) for t, rss in self.memory],
+        }
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    def pick(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+    return {"p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99), "max": pick(1.0)}
+
+
+def print_report(result: dict):
+    print(f"Elapsed: {result['elapsed_s']}s over {result['tickets']} tickets")
+    print(f"Relayed: {result['relayed']} ({result['throughput_per_s']}/s), lost: {result['lost']}")
+    print(f"REST requests: {result['requests']}, 429s: {result['rate_limited_429']}")
+    for route, count in sorted(result["requests_by_route"].items()):
+        print(f"  {route}: {count}")
+    for direction, stats in result["latency_ms"].items():
+        if stats:
+            print(f"Latency {direction} (ms): " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+    if result["memory_rss_bytes"]:
+        peak = max(rss for _, rss in result["memory_rss_bytes"])
+        last = result["memory_rss_bytes"][-1][1]
+        print(f"RSS: peak {peak / 2**20:.1f} MiB, final {last / 2**20:.1f} MiB")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise argparse.ArgumentTypeError(f"unknown traffic kind: {kind}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Rainfall cogs against a fake Discord.")
+    parser.add_argument("--tickets", type=int, default=500)
+    parser.add_argument("--guilds", type=int, default=1)
+    parser.add_argument("--staff", type=int, default=10)
+    parser.add_argument("--anon-ratio", type=float, default=0.5)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of randomized traffic")
+    parser.add_argument("--rate", type=float, default=100.0, help="events per second (randomized traffic)")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="e.g. user_dm=50,staff_reply=50")
+    parser.add_argument("--script", help="JSON-lines file of scripted events, replaces randomized traffic")
+    parser.add_argument("--latency", type=float, default=0.08, help="mean REST latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--gateway-delay", type=float, default=0.0)
+    parser.add_argument("--route-limit", type=int, default=5, help="requests per route bucket window")
+    parser.add_argument("--route-window", type=float, default=5.0)
+    parser.add_argument("--global-limit", type=int, default=50, help="requests per second across all routes")
+    parser.add_argument("--attachment-size", type=int, default=256 * 1024)
+    parser.add_argument("--memory-interval", type=float, default=1.0)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="write the full report to this path")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    if args.script:
+        args.script = os.path.abspath(args.script)
+    if args.json:
+        args.json = os.path.abspath(args.json)
+    os.chdir(tempfile.mkdtemp(prefix="rainfall-loadsim-"))
+    result = asyncio.run(Simulator(args).run())
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()